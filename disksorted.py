@@ -4,13 +4,21 @@
 Simple helper for sorting when your ordinary memory wont cut it.
 """
 
+import bisect
+import collections
+import hashlib
 import itertools
+import multiprocessing
+import os
+import re
+import shutil
 import sys
 import tempfile
 import operator
 import json
 import marshal
 import functools
+import types
 try:
     import cPickle as pickle
 except:
@@ -20,7 +28,9 @@ import heapq
 __author__ = 'Vajk Hermecz'
 __email__ = 'vhermecz@gmail.com'
 __version__ = '0.9'
-__all__ = ['disksorted', 'diskiterator', 'merge', 'SERIALIZER_PICKLE', 'SERIALIZER_JSON',
+__all__ = ['disksorted', 'diskiterator', 'merge', 'disksorted_join', 'disksorted_groupby',
+           'JOIN_INNER', 'JOIN_LEFT', 'JOIN_OUTER', 'DiskSortedCollection', 'SortCache',
+           'AdaptiveChunksize', 'disksorted_lines', 'SERIALIZER_PICKLE', 'SERIALIZER_JSON',
            'SERIALIZER_MARSHAL']
 
 
@@ -61,6 +71,8 @@ def key_to_reverse_order(key_fn):
 
 
 MERGE_SENTINEL = object()
+_imap = getattr(itertools, "imap", map)
+_izip = getattr(itertools, "izip", zip)
 
 
 def merge(chunks, key=None, reverse=False):
@@ -103,6 +115,38 @@ SERIALIZER_JSON = (_json_dump, _json_load, "w+t")
 SERIALIZER_MARSHAL = (marshal.dump, marshal.load, "w+b")
 
 
+def _preserves_items(serializer):
+    """Check whether items read back compare like the original ones (JSON turns tuples to lists)"""
+    return serializer in (SERIALIZER_PICKLE, SERIALIZER_MARSHAL)
+
+
+def _chunk_writer(iterable, fp, dump):
+    """Write items to fp as a series of sublists, closed by an empty one"""
+    count = 0
+    for subchunk in chunks(iterable, 128):
+        dump(list(subchunk), fp)
+        count += len(subchunk)
+    dump(list(), fp)
+    return count
+
+
+def _chunk_reader(fp, load, close=True):
+    """Read items written by _chunk_writer, closing fp when done"""
+    try:
+        while True:
+            sublist = load(fp)
+            if not sublist:
+                break
+            for item in sublist:
+                yield item
+    finally:
+        if close:
+            try:
+                fp.close()
+            except Exception:
+                pass
+
+
 def diskiterator(iterable, fp=None, serializer=SERIALIZER_PICKLE):
     '''
     Cache iterator to disk
@@ -113,31 +157,532 @@ def diskiterator(iterable, fp=None, serializer=SERIALIZER_PICKLE):
     :type serializer: (function, function)
     '''
     dump, load, filemode = serializer
-    def chunk_writer(chunk, fp=None):
-        fp = fp or tempfile.TemporaryFile(mode=filemode)
-        for subchunk in chunks(chunk, 128):
+    fp = fp or tempfile.TemporaryFile(mode=filemode)
+    _chunk_writer(iterable, fp, dump)
+    fp.seek(0)
+    return _chunk_reader(fp, load)
+
+
+def _write_run(path, iterable, serializer):
+    """Write items to a file in the diskiterator format, returns the number of items written"""
+    dump, _, filemode = serializer
+    with open(path, filemode) as fp:
+        return _chunk_writer(iterable, fp, dump)
+
+
+def _read_run(path, serializer):
+    """Iterate items of a file written by _write_run"""
+    _, load, filemode = serializer
+    return _chunk_reader(open(path, filemode.replace("w+", "r")), load)
+
+
+CHECKPOINT_MANIFEST = "disksorted.json"
+
+
+def _process_rss():
+    """Get the resident set size of the process in bytes, None if unknown"""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+_CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _cgroup_paths():
+    """Get the cgroup of the process in the v2 hierarchy and in the v1 memory controller"""
+    v2, v1 = "/", "/"
+    try:
+        with open("/proc/self/cgroup") as fp:
+            for line in fp:
+                _, controllers, path = line.rstrip("\n").split(":", 2)
+                if not controllers:
+                    v2 = path
+                elif "memory" in controllers.split(","):
+                    v1 = path
+    except (IOError, OSError, ValueError):
+        pass
+    return v2, v1
+
+
+def _read_memory_value(path, name=None):
+    """Read a byte count from a cgroup file, or the named entry of memory.stat"""
+    with open(path) as fp:
+        if name is None:
+            value = fp.read().strip()
+            return None if value == "max" else int(value)
+        for line in fp:
+            entry, _, value = line.partition(" ")
+            if entry == name:
+                return int(value)
+    return 0
+
+
+def _cgroup_available_memory():
+    """Get the memory left below the cgroup limit in bytes, None if not limited"""
+    v2, v1 = _cgroup_paths()
+    v1_root = os.path.join(_CGROUP_ROOT, "memory")
+    candidates = [
+        (directory, "memory.max", "memory.current", "inactive_file")
+        for directory in (os.path.join(_CGROUP_ROOT, v2.lstrip("/")), _CGROUP_ROOT)
+    ] + [
+        (directory, "memory.limit_in_bytes", "memory.usage_in_bytes", "total_inactive_file")
+        for directory in (os.path.join(v1_root, v1.lstrip("/")), v1_root)
+    ]
+    for directory, limit_name, usage_name, inactive_name in candidates:
+        try:
+            limit = _read_memory_value(os.path.join(directory, limit_name))
+            usage = _read_memory_value(os.path.join(directory, usage_name))
+        except (IOError, OSError, ValueError):
+            continue
+        if limit is None or limit >= 2 ** 60:
+            # unlimited, v1 reports it as a huge number
+            continue
+        try:
+            # inactive page cache is reclaimed before the limit is enforced
+            usage -= _read_memory_value(os.path.join(directory, "memory.stat"), inactive_name)
+        except (IOError, OSError, ValueError):
+            pass
+        return max(limit - usage, 0)
+    return None
+
+
+def _available_memory():
+    """Get the memory available to be allocated in bytes, None if unknown"""
+    available = []
+    try:
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    available.append(int(line.split()[1]) * 1024)
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    # in a container, meminfo reports the memory of the host
+    cgroup = _cgroup_available_memory()
+    if cgroup is not None:
+        available.append(cgroup)
+    return min(available) if available else None
+
+
+class AdaptiveChunksize(object):
+    '''
+    Memory pressure driven run sizing, to be passed as chunksize to disksorted
+    Memory is checked every check_every items while a run is filled. The run is flushed early once
+    the process RSS exceeds soft_limit, or the available memory falls below reserve, and the next
+    run is shrunk. Runs filled without pressure grow the next run, while there is plenty of
+    headroom. Instances can be shared between sorts running side by side.
+    Available memory is the lower of MemAvailable and the room left below the cgroup (v2 or v1)
+    memory limit, so that sorts in a container share its limit instead of the host's memory.
+    NOTE: Memory is read from /proc and /sys/fs/cgroup, so it is not checked on other systems
+    :param soft_limit: specifies the process RSS in bytes to stay below. (not checked if omitted.)
+    :param reserve: specifies the system available memory in bytes to be left for others. (not
+        checked if omitted.)
+    :param initial: specifies the number of items in the first run.
+    :param minimum: specifies the smallest number of items in a run, unless the input is exhausted.
+    :param maximum: specifies the largest number of items in a run.
+    :param check_every: specifies the number of items added to a run between memory checks.
+    :type soft_limit: int|NoneType
+    :type reserve: int|NoneType
+    :type initial: int
+    :type minimum: int
+    :type maximum: int
+    :type check_every: int
+    :ivar sizes: number of items of the runs filled so far, for reporting.
+    '''
+    def __init__(self, soft_limit=None, reserve=2 ** 28, initial=100000, minimum=1000,
+                 maximum=sys.maxsize, check_every=1000):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("minimum, initial and maximum to be increasing positive integers")
+        if check_every < 1:
+            raise ValueError("check_every to be positive integer")
+        self.soft_limit = soft_limit
+        self.reserve = reserve
+        self.minimum = minimum
+        self.maximum = maximum
+        self.check_every = check_every
+        self.size = initial
+        self.sizes = []
+
+    def __repr__(self):
+        return "AdaptiveChunksize(soft_limit={0!r}, reserve={1!r}, minimum={2!r}, " \
+            "maximum={3!r})".format(self.soft_limit, self.reserve, self.minimum, self.maximum)
+
+    def under_pressure(self):
+        """Check whether memory usage crossed the limits"""
+        if self.soft_limit is not None:
+            rss = _process_rss()
+            if rss is not None and rss > self.soft_limit:
+                return True
+        if self.reserve is not None:
+            available = _available_memory()
+            if available is not None and available < self.reserve:
+                return True
+        return False
+
+    def has_headroom(self):
+        """Check whether memory usage is well below the limits"""
+        if self.soft_limit is not None:
+            rss = _process_rss()
+            if rss is not None and rss > self.soft_limit // 2:
+                return False
+        if self.reserve is not None:
+            available = _available_memory()
+            if available is not None and available < self.reserve * 2:
+                return False
+        return True
+
+    def fill(self, chunk, it):
+        """Extend chunk with items of it, until the run is full or memory is short"""
+        size = self.size
+        pressure = False
+        while len(chunk) < size:
+            step = min(self.check_every, size - len(chunk))
+            before = len(chunk)
+            chunk.extend(itertools.islice(it, step))
+            if len(chunk) - before < step:
+                break
+            if len(chunk) >= self.minimum and self.under_pressure():
+                pressure = True
+                break
+        if pressure:
+            self.size = max(self.minimum, len(chunk) // 2)
+        elif len(chunk) == size and self.has_headroom():
+            self.size = min(self.maximum, size * 2)
+        if chunk:
+            self.sizes.append(len(chunk))
+        return chunk
+
+
+class _BatchKey(object):
+    """Sorts chunks by the keys computed for all of their items at once by batch_key"""
+    def __init__(self, batch_key):
+        self.batch_key = batch_key
+
+    def __repr__(self):
+        return "_BatchKey({0})".format(_callable_id(self.batch_key))
+
+    def sort(self, chunk, reverse, pairs):
+        """Sort chunk in place, returns its (key, item) pairs if pairs is set, else chunk"""
+        if not chunk:
+            return chunk
+        keys = self.batch_key(chunk)
+        if len(keys) != len(chunk):
+            raise ValueError("batch_key to return a key for every item")
+        if not pairs:
+            # list.sort calls the key function once for every item, in order
+            chunk.sort(key=functools.partial(next, iter(keys)), reverse=reverse)
+            return chunk
+        pairs = list(_izip(keys, chunk))
+        pairs.sort(key=operator.itemgetter(0), reverse=reverse)
+        return pairs
+
+
+def _sort(chunk, key, reverse, pairs=True):
+    """Sort chunk in place, returns the items to be merged: (key, item) pairs for a _BatchKey"""
+    if isinstance(key, _BatchKey):
+        return key.sort(chunk, reverse, pairs)
+    chunk.sort(key=key, reverse=reverse)
+    return chunk
+
+
+def _merge_key(key):
+    """Key to merge the items returned by _sort with"""
+    return operator.itemgetter(0) if isinstance(key, _BatchKey) else key
+
+
+def _items(merged, key):
+    """Items of merged pairs of a _BatchKey, other merged items as they are"""
+    return _imap(operator.itemgetter(1), merged) if isinstance(key, _BatchKey) else merged
+
+
+def _fill(chunk, it, chunksize):
+    """Extend chunk with items of it, up to chunksize items"""
+    if isinstance(chunksize, AdaptiveChunksize):
+        chunksize.fill(chunk, it)
+    else:
+        chunk.extend(itertools.islice(it, chunksize - len(chunk)))
+    return chunk
+
+
+def _sorted_chunks(iterable, key, reverse, chunksize):
+    """Split iterable to sorted runs of chunksize items"""
+    it = iter(iterable)
+    chunk = _fill([], it, chunksize)
+    while chunk:
+        yield _sort(chunk, key, reverse)
+        chunk = _fill([], it, chunksize)
+
+
+def _code_id(code):
+    """Identify a code object by its bytecode and the names and constants it refers to"""
+    consts = tuple(_code_id(const) if isinstance(const, types.CodeType) else const
+                   for const in code.co_consts)
+    return code.co_code, code.co_names, consts
+
+
+def _value_id(value, seen):
+    return _callable_id(value, seen) if callable(value) else repr(value)
+
+
+def _callable_id(fn, seen=()):
+    """Identify a function by its name, bytecode and the values it captured"""
+    code = getattr(fn, '__code__', None)
+    if code is None:
+        return repr(fn)
+    if id(fn) in seen:
+        # recursive closure
+        return fn.__name__
+    seen += (id(fn),)
+    closure = []
+    for cell in fn.__closure__ or ():
+        try:
+            closure.append(_value_id(cell.cell_contents, seen))
+        except ValueError:
+            # empty cell
+            closure.append(None)
+    defaults = [_value_id(value, seen) for value in fn.__defaults__ or ()]
+    kwdefaults = sorted((name, _value_id(value, seen))
+                        for name, value in (getattr(fn, '__kwdefaults__', None) or {}).items())
+    bound = _value_id(fn.__self__, seen) if hasattr(fn, '__self__') else None
+    return repr((fn.__module__, getattr(fn, '__qualname__', fn.__name__), _code_id(code),
+                 closure, defaults, kwdefaults, bound))
+
+
+def _digest(prefix, key, reverse, serializer):
+    """Identify the parameters of a sort"""
+    return hashlib.sha1(repr((
+        prefix, _callable_id(key), bool(reverse),
+        tuple(_callable_id(fn) for fn in serializer[:2]), serializer[2],
+    )).encode("utf-8")).hexdigest()
+
+
+def _write_manifest(path, manifest):
+    """Atomically replace the json file at path"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fp:
+        json.dump(manifest, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    getattr(os, "replace", os.rename)(tmp, path)
+
+
+def _checkpointed_runs(iterable, key, reverse, chunksize, serializer, workdir, fingerprint):
+    """Get paths of the sorted runs of iterable, resuming from the manifest in workdir"""
+    path = os.path.join(workdir, CHECKPOINT_MANIFEST)
+    digest = _digest((chunksize, fingerprint), key, reverse, serializer)
+    manifest = dict(digest=digest, runs=[], offset=0, complete=False)
+    if os.path.exists(path):
+        with open(path) as fp:
+            manifest = json.load(fp)
+        if manifest["digest"] != digest:
+            raise ValueError("workdir to hold a sort with the same parameters")
+    if not manifest["complete"]:
+        dump, _, filemode = serializer
+        it = iter(iterable)
+        for _ in itertools.islice(it, manifest["offset"]):
+            pass
+        for chunk in _sorted_chunks(it, key, reverse, chunksize):
+            name = "run{0}".format(len(manifest["runs"]))
+            with open(os.path.join(workdir, name), filemode) as fp:
+                manifest["offset"] += _chunk_writer(chunk, fp, dump)
+                fp.flush()
+                os.fsync(fp.fileno())
+            manifest["runs"].append(name)
+            _write_manifest(path, manifest)
+        manifest["complete"] = True
+        _write_manifest(path, manifest)
+    return [os.path.join(workdir, name) for name in manifest["runs"]]
+
+
+def _remove_checkpoint(workdir):
+    """Remove the manifest and runs of a finished sort from workdir"""
+    path = os.path.join(workdir, CHECKPOINT_MANIFEST)
+    with open(path) as fp:
+        names = json.load(fp)["runs"]
+    os.remove(path)
+    for name in names:
+        os.remove(os.path.join(workdir, name))
+
+
+class SortCache(object):
+    '''
+    On-disk cache of sorted runs, to be shared between disksorted calls
+    Entries are keyed by a fingerprint of the input, the key function, reverse and the serializer.
+    Least recently used entries are evicted, once the size of the cache exceeds maxsize.
+    NOTE: Key functions are identified by their name, bytecode, closure, defaults and bound object,
+    values by their repr. Use a distinct fingerprint for key functions depending on global state.
+    :param directory: to store cached runs in. (created if missing.)
+    :param maxsize: specifies the largest number of bytes to be kept on disk.
+    :type directory: str
+    :type maxsize: int
+    '''
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory, maxsize=2 ** 30):
+        self.directory = directory
+        self.maxsize = maxsize
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def runs(self, iterable, key, reverse, chunksize, serializer, fingerprint=None):
+        """Get paths of the sorted runs of iterable, sorting it on cache miss"""
+        if fingerprint is None:
+            fingerprint = self._input_fingerprint(iterable)
+        digest = _digest(fingerprint, key, reverse, serializer)
+        entry = os.path.join(self.directory, digest)
+        if not os.path.exists(os.path.join(entry, self.MANIFEST)):
+            self._store(entry, _sorted_chunks(iterable, key, reverse, chunksize), serializer)
+            self._evict(keep=entry)
+        os.utime(entry, None)
+        with open(os.path.join(entry, self.MANIFEST)) as fp:
+            return [os.path.join(entry, name) for name in json.load(fp)["runs"]]
+
+    def clear(self):
+        """Remove all entries"""
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    @staticmethod
+    def _input_fingerprint(iterable):
+        path = getattr(iterable, "name", None)
+        if not isinstance(path, str) or not os.path.isfile(path):
+            raise ValueError("fingerprint to be provided for caching non-file iterables")
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_size, stat.st_mtime
+
+    def _store(self, entry, sorted_chunks, serializer):
+        tmp = tempfile.mkdtemp(prefix=".tmp", dir=self.directory)
+        try:
+            names = []
+            for chunk in sorted_chunks:
+                names.append("run{0}".format(len(names)))
+                _write_run(os.path.join(tmp, names[-1]), chunk, serializer)
+            _write_manifest(os.path.join(tmp, self.MANIFEST), {"runs": names})
+            os.rename(tmp, entry)
+        except OSError:
+            if not os.path.exists(os.path.join(entry, self.MANIFEST)):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".tmp") or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, run)) for run in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxsize:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+def _identity(x):
+    return x
+
+
+def _order_key(reverse):
+    """Get function mapping keys to values comparing in the order of the sort"""
+    return key_to_reverse_order(_identity) if reverse else _identity
+
+
+def _write_indexed_run(path, iterable, serializer, key):
+    """Write items like _write_run, returns (first key, file offset) for every sublist"""
+    dump, _, filemode = serializer
+    index = []
+    with open(path, filemode) as fp:
+        for subchunk in chunks(iterable, 128):
+            index.append((key(subchunk[0]), fp.tell()))
             dump(list(subchunk), fp)
         dump(list(), fp)
-        fp.seek(0)
-        return fp
-    def chunk_reader(fp):
+    return index
+
+
+def _merge_range(task):
+    """Merge items with keys in [lo, hi) of indexed runs into a segment file, in a worker"""
+    runs, key, reverse, serializer, lo, hi, path = task
+    key = _merge_key(key) or _identity
+    order = _order_key(reverse)
+    _, load, filemode = serializer
+    pieces = []
+    for run, index in runs:
+        start = 0
+        if lo is not None:
+            start = max(bisect.bisect_left([order(first) for first, _ in index], order(lo)) - 1, 0)
+        fp = open(run, filemode.replace("w+", "r"))
+        if index:
+            fp.seek(index[start][1])
+        piece = _chunk_reader(fp, load)
+        if lo is not None:
+            piece = itertools.dropwhile(lambda item: order(key(item)) < order(lo), piece)
+        if hi is not None:
+            piece = itertools.takewhile(lambda item: order(key(item)) < order(hi), piece)
+        pieces.append(piece)
+    _write_run(path, merge(pieces, key, reverse), serializer)
+    return path
+
+
+def _parallel_merge(sorted_chunks, key, reverse, serializer, workers):
+    """Merge sorted chunks by splitting them into key ranges merged in worker processes"""
+    merge_key = _merge_key(key) or _identity
+    directory = tempfile.mkdtemp(prefix="disksorted")
+    try:
+        runs = []
+        for chunk in sorted_chunks:
+            path = os.path.join(directory, "run{0}".format(len(runs)))
+            runs.append((path, _write_indexed_run(path, chunk, serializer, merge_key)))
+        if not runs:
+            return
+        order = _order_key(reverse)
+        samples = sorted((first for _, index in runs for first, _ in index), key=order)
+        splitters = []
+        for idx in range(1, workers):
+            sample = samples[len(samples) * idx // workers]
+            if not splitters or order(splitters[-1]) < order(sample):
+                splitters.append(sample)
+        bounds = [None] + splitters + [None]
+        tasks = [(runs, key, reverse, serializer, lo, hi,
+                  os.path.join(directory, "segment{0}".format(idx)))
+                 for idx, (lo, hi) in enumerate(zip(bounds, bounds[1:]))]
+        if len(tasks) == 1:
+            pieces = [_read_run(path, serializer) for path, _ in runs]
+            for item in merge(pieces, merge_key, reverse):
+                yield item
+            return
+        pool = multiprocessing.Pool(len(tasks))
         try:
-            while True:
-                sublist = load(fp)
-                if not sublist:
-                    break
-                for item in sublist:
+            for path in pool.imap(_merge_range, tasks):
+                for item in _read_run(path, serializer):
                     yield item
+                os.remove(path)
         finally:
-            try:
-                fp.close()
-            except Exception:
-                pass
-    return chunk_reader(chunk_writer(iterable, fp=fp))
+            pool.terminate()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _spill(chunk, serializer, budget):
+    """Cache sorted chunk with diskiterator, in memory while it fits in budget bytes"""
+    if budget <= 0:
+        return diskiterator(chunk, serializer=serializer), 0
+    fp = tempfile.SpooledTemporaryFile(max_size=budget, mode=serializer[2])
+    piece = diskiterator(chunk, fp=fp, serializer=serializer)
+    fp.seek(0, 2)
+    size = fp.tell()
+    fp.seek(0)
+    return piece, size if size <= budget else 0
 
 
 def disksorted(iterable, key=None, reverse=False, chunksize=sys.maxsize,
-               serializer=SERIALIZER_PICKLE):
+               serializer=SERIALIZER_PICKLE, cache=None, fingerprint=None, workdir=None,
+               merge_workers=1, memory_budget=0, batch_key=None):
     '''
     Sorting function for collections not fitting into memory
     NOTE: Uses temporary files
@@ -146,36 +691,621 @@ def disksorted(iterable, key=None, reverse=False, chunksize=sys.maxsize,
         each list element.
     :param reverse: is a boolean value. If set to True, then the list elements are sorted as if
         each comparison were reversed.
-    :param chunksize: specifies the largest number of items to be held in memory at once.
+    :param chunksize: specifies the largest number of items to be held in memory at once, or the
+        AdaptiveChunksize policy choosing it for every run.
     :param serializer: defines the methods to be used for transfering data between disk and memory.
+    :param cache: to store sorted runs in, and reuse them on later calls with the same input.
+    :param fingerprint: identifies the input for the cache (computed for files if omitted), or
+        for the workdir, to refuse resuming a sort of a different input.
+    :param workdir: to checkpoint sorted runs in. A sort restarted with the same workdir and
+        parameters resumes from the last completed run, skipping the input consumed by the earlier
+        attempt. Runs are removed once all items have been read.
+    :param merge_workers: specifies the number of processes to merge runs with. Runs are split into
+        key ranges, each merged in a separate process, and streamed back in order. The key
+        function has to be picklable, and the serializer SERIALIZER_PICKLE or SERIALIZER_MARSHAL
+        for merge_workers > 1.
+    :param memory_budget: specifies the number of bytes of serialized runs to be kept in memory
+        instead of temporary files. Not supported with cache, workdir and merge_workers, which need
+        every run on disk. With SERIALIZER_PICKLE and SERIALIZER_MARSHAL, the final run is merged
+        from memory too, unless cache or workdir are used, or merge_workers > 1 and the input
+        exceeds chunksize.
+    :param batch_key: specifies a function of a list of elements that is used to extract the
+        comparison keys of all of them at once, instead of key. Keys are computed once per item,
+        and stored along with the items in temporary files.
     :type key: function|NoneType
     :type reverse: bool
-    :type chunksize: int|NoneType
+    :type chunksize: int|AdaptiveChunksize
     :type serializer: (function, function)
+    :type cache: SortCache|NoneType
+    :type fingerprint: object
+    :type workdir: str|NoneType
+    :type merge_workers: int
+    :type memory_budget: int
+    :type batch_key: function|NoneType
     '''
-    if chunksize < 1:
+    if not isinstance(chunksize, AdaptiveChunksize) and chunksize < 1:
         raise ValueError("chunksize to be positive integer")
-    single = True
+    if merge_workers < 1:
+        raise ValueError("merge_workers to be positive integer")
+    if batch_key is not None:
+        if key is not None:
+            raise ValueError("key and batch_key to be used exclusively")
+        key = _BatchKey(batch_key)
+    if merge_workers > 1 and (cache is not None or workdir is not None):
+        raise ValueError("merge_workers to be used without cache and workdir")
+    if merge_workers > 1 and not _preserves_items(serializer):
+        # range bounds are sampled from items in memory, but compared with items read back
+        raise ValueError("merge_workers to be used with SERIALIZER_PICKLE or SERIALIZER_MARSHAL")
+    if memory_budget and (merge_workers > 1 or cache is not None or workdir is not None):
+        raise ValueError("memory_budget to be used without cache, workdir and merge_workers")
+    merge_key = _merge_key(key)
+    if merge_workers > 1:
+        it = iter(iterable)
+        chunk = _fill([], it, chunksize)
+        head = next(it, MERGE_SENTINEL)
+        if head is MERGE_SENTINEL:
+            chunk = _sort(chunk, key, reverse, pairs=False)
+        else:
+            # more than a single chunk, so runs have to be written to disk for the workers
+            sorted_chunks = itertools.chain([_sort(chunk, key, reverse)],
+                                            _sorted_chunks(itertools.chain([head], it), key,
+                                                           reverse, chunksize))
+            chunk = _items(_parallel_merge(sorted_chunks, key, reverse, serializer, merge_workers),
+                           key)
+        for item in chunk:
+            yield item
+        return
+    if cache is not None and workdir is not None:
+        raise ValueError("cache and workdir to be used exclusively")
+    if cache is not None or workdir is not None:
+        if cache is not None:
+            paths = cache.runs(iterable, key, reverse, chunksize, serializer,
+                               fingerprint=fingerprint)
+        else:
+            paths = _checkpointed_runs(iterable, key, reverse, chunksize, serializer, workdir,
+                                       fingerprint)
+        pieces = [_read_run(path, serializer) for path in paths]
+        chunk = pieces[0] if len(pieces) == 1 else merge(pieces, merge_key, reverse)
+        for item in _items(chunk, key):
+            yield item
+        if cache is None:
+            _remove_checkpoint(workdir)
+        return
     pieces = []
-    chunk = []
-    for chunk in chunks(iterable, chunksize):
-        chunk = sorted(chunk, key=key, reverse=reverse)
-        if len(chunk) == chunksize:
-            single = False
-        if not single:
-            pieces.append(diskiterator(chunk, serializer=serializer))
-    if not single:
-        chunk = merge(pieces, key, reverse)
+    it = iter(iterable)
+    chunk = _fill([], it, chunksize)
+    for head in it:
+        # there are more items, so spill the chunk at hand before reading the next one
+        piece, used = _spill(_sort(chunk, key, reverse), serializer, memory_budget)
+        pieces.append(piece)
+        memory_budget -= used
+        chunk = _fill([head], it, chunksize)
+    chunk = _sort(chunk, key, reverse, pairs=bool(pieces))
+    if pieces:
+        if _preserves_items(serializer):
+            # the final chunk is merged straight from memory
+            pieces.append(iter(chunk))
+        else:
+            # keep items of all runs in the same, deserialized form
+            pieces.append(_spill(chunk, serializer, memory_budget)[0])
+        chunk = _items(merge(pieces, merge_key, reverse), key)
     for item in chunk:
         yield item
 
 
+def disksorted_groupby(iterable, key=None, reverse=False, chunksize=sys.maxsize,
+                       serializer=SERIALIZER_PICKLE):
+    '''
+    Group items of a collection not fitting into memory by key
+    Like itertools.groupby, but sorts the input with disksorted first, so every key is yielded
+    once, together with an iterator over all of its items.
+    :param iterable: of items to be grouped
+    :param key: specifies a function of one argument that is used to extract the grouping key
+        from each list element.
+    :param reverse: is a boolean value. If set to True, then the groups are yielded in reverse
+        order.
+    :param chunksize: specifies the largest number of items to be held in memory at once.
+    :param serializer: defines the methods to be used for transfering data between disk and memory.
+    :type key: function|NoneType
+    :type reverse: bool
+    :type chunksize: int|NoneType
+    :type serializer: (function, function)
+    '''
+    return itertools.groupby(disksorted(iterable, key=key, reverse=reverse, chunksize=chunksize,
+                                        serializer=serializer), key=key)
+
+
+JOIN_INNER = 'inner'
+JOIN_LEFT = 'left'
+JOIN_OUTER = 'outer'
+JOIN_GROUPSIZE = 10000
+
+
+class _SpillBuffer(object):
+    """Replayable list of items, moving its content to disk every threshold items"""
+    def __init__(self, threshold, serializer):
+        self.threshold = threshold
+        self.serializer = serializer
+        self.items = []
+        self.fp = None
+        self.spilled = 0
+
+    def append(self, item):
+        self.items.append(item)
+        if len(self.items) >= self.threshold:
+            dump, _, filemode = self.serializer
+            self.fp = self.fp or tempfile.TemporaryFile(mode=filemode)
+            _chunk_writer(self.items, self.fp, dump)
+            self.spilled += 1
+            self.items = []
+
+    def __bool__(self):
+        return bool(self.spilled or self.items)
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        if self.fp is not None:
+            load = self.serializer[1]
+            self.fp.seek(0)
+            # every spill is a separate run in the diskiterator format
+            for _ in range(self.spilled):
+                for item in _chunk_reader(self.fp, load, close=False):
+                    yield item
+        for item in self.items:
+            yield item
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+
+
+def disksorted_join(left, right, key=None, how=JOIN_INNER, chunksize=sys.maxsize,
+                    serializer=SERIALIZER_PICKLE, groupsize=JOIN_GROUPSIZE):
+    '''
+    Sort-merge join of two collections not fitting into memory
+    Both sides are sorted with disksorted, then joined in a single streaming pass. Yields
+    (left_item, right_item) pairs, missing sides are filled with None.
+    :param left: iterable of items on the left side of the join
+    :param right: iterable of items on the right side of the join
+    :param key: specifies a function of one argument that is used to extract the join key from
+        the items of both sides.
+    :param how: is one of JOIN_INNER, JOIN_LEFT or JOIN_OUTER.
+    :param chunksize: specifies the largest number of items to be held in memory at once.
+    :param serializer: defines the methods to be used for transfering data between disk and memory.
+    :param groupsize: specifies the largest number of right items with the same key to be held in
+        memory, larger groups are spilled to disk.
+    :type key: function|NoneType
+    :type how: str
+    :type chunksize: int|NoneType
+    :type serializer: (function, function)
+    :type groupsize: int
+    '''
+    if how not in (JOIN_INNER, JOIN_LEFT, JOIN_OUTER):
+        raise ValueError("how to be one of JOIN_INNER, JOIN_LEFT, JOIN_OUTER")
+    if groupsize < 1:
+        raise ValueError("groupsize to be positive integer")
+    return _join(left, right, key or (lambda x: x), how, chunksize, serializer, groupsize)
+
+
+def _join(left, right, key, how, chunksize, serializer, groupsize):
+    def tagged_key(record):
+        return key(record[1])
+    # merge yields equal keys in stream order, so the right group is complete before the first
+    # left item of the same key arrives
+    streams = [
+        ((True, item) for item in disksorted(right, key=key, chunksize=chunksize,
+                                             serializer=serializer)),
+        ((False, item) for item in disksorted(left, key=key, chunksize=chunksize,
+                                              serializer=serializer)),
+    ]
+    for _, group in itertools.groupby(merge(streams, key=tagged_key), key=tagged_key):
+        matches = _SpillBuffer(groupsize, serializer)
+        matched = False
+        try:
+            for is_right, item in group:
+                if is_right:
+                    matches.append(item)
+                elif matches:
+                    matched = True
+                    for match in matches:
+                        yield item, match
+                elif how != JOIN_INNER:
+                    yield item, None
+            if how == JOIN_OUTER and not matched:
+                for match in matches:
+                    yield None, match
+        finally:
+            matches.close()
+
+
+class DiskSortedCollection(object):
+    '''
+    Sorted collection not fitting into memory, which can be appended to
+    Items are buffered in memory, and written to disk as immutable sorted runs every chunksize
+    items. Once there are fanout runs of similar size, they are compacted into a single run, so
+    appending costs amortized O(new data) instead of sorting everything again. Iterating merges
+    the live runs with the in-memory buffer.
+    NOTE: Uses temporary files, call close() or use it as a context manager to remove them
+    :param key: specifies a function of one argument that is used to extract a comparison key from
+        each list element.
+    :param reverse: is a boolean value. If set to True, then the list elements are sorted as if
+        each comparison were reversed.
+    :param chunksize: specifies the largest number of items to be buffered in memory.
+    :param serializer: defines the methods to be used for transfering data between disk and memory.
+    :param fanout: specifies the number of similarly sized runs to be compacted together.
+    :param directory: to create the temporary directory of runs in. (system default if omitted.)
+    :type key: function|NoneType
+    :type reverse: bool
+    :type chunksize: int
+    :type serializer: (function, function)
+    :type fanout: int
+    :type directory: str|NoneType
+    '''
+    def __init__(self, key=None, reverse=False, chunksize=100000, serializer=SERIALIZER_PICKLE,
+                 fanout=4, directory=None):
+        if chunksize < 1:
+            raise ValueError("chunksize to be positive integer")
+        if fanout < 2:
+            raise ValueError("fanout to be at least 2")
+        self.key = key
+        self.reverse = reverse
+        self.chunksize = chunksize
+        self.serializer = serializer
+        self.fanout = fanout
+        self.directory = tempfile.mkdtemp(prefix="disksorted", dir=directory)
+        self.runs = []
+        self.buffer = []
+        self._run_ids = itertools.count()
+
+    def add(self, item):
+        """Add a single item to the collection"""
+        self.buffer.append(item)
+        if len(self.buffer) >= self.chunksize:
+            self.flush()
+
+    def extend(self, iterable):
+        """Add all items of iterable to the collection"""
+        it = iter(iterable)
+        while True:
+            # top up the buffer only, so that runs never exceed chunksize
+            self.buffer.extend(itertools.islice(it, self.chunksize - len(self.buffer)))
+            if len(self.buffer) < self.chunksize:
+                break
+            self.flush()
+
+    def flush(self):
+        """Write buffered items to disk as a new run"""
+        if not self.buffer:
+            return
+        self.buffer.sort(key=self.key, reverse=self.reverse)
+        self.runs.append(self._write(self.buffer))
+        self.buffer = []
+        self._compact_tiers()
+
+    def compact(self):
+        """Flush buffered items and merge all runs into a single one"""
+        self.flush()
+        if len(self.runs) > 1:
+            self._compact(self.runs)
+
+    def _write(self, iterable):
+        path = os.path.join(self.directory, "run{0}".format(next(self._run_ids)))
+        return path, _write_run(path, iterable, self.serializer)
+
+    def _tier(self, length):
+        tier = 0
+        while length >= self.chunksize * self.fanout ** (tier + 1):
+            tier += 1
+        return tier
+
+    def _compact_tiers(self):
+        while True:
+            tiers = {}
+            for run in self.runs:
+                tiers.setdefault(self._tier(run[1]), []).append(run)
+            full = [runs for _, runs in sorted(tiers.items()) if len(runs) >= self.fanout]
+            if not full:
+                break
+            self._compact(full[0])
+
+    def _compact(self, runs):
+        pieces = [_read_run(path, self.serializer) for path, _ in runs]
+        compacted = self._write(merge(pieces, self.key, self.reverse))
+        self.runs = [run for run in self.runs if run not in runs] + [compacted]
+        for path, _ in runs:
+            os.remove(path)
+
+    def __iter__(self):
+        pieces = [_read_run(path, self.serializer) for path, _ in self.runs]
+        pieces.append(iter(sorted(self.buffer, key=self.key, reverse=self.reverse)))
+        if len(pieces) == 1:
+            return pieces[0]
+        return merge(pieces, self.key, self.reverse)
+
+    def __len__(self):
+        return sum(length for _, length in self.runs) + len(self.buffer)
+
+    def close(self):
+        """Remove all runs from disk"""
+        self.runs = []
+        self.buffer = []
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+LINE_BUFFERSIZE = 64 * 2 ** 20
+_NUMERIC_PREFIX = re.compile(br"\s*(-?(?:\d+\.?\d*|\.\d+))")
+
+
+class _LineKey(object):
+    """Comparison key of a newline terminated line of bytes, picklable for worker processes"""
+    def __init__(self, field, field_end, separator, numeric):
+        self.numeric = numeric
+        self.pattern = None
+        if field is None:
+            return
+        if separator is None:
+            # like sort, fields are split before blanks following non-blanks, so a field starts
+            # with the blanks preceding it
+            # bytes are built by concatenation, as they only support % formatting on Python 3.5+
+            skip = br"(?:[ \t]*[^ \t]*){" + str(field - 1).encode() + b"}"
+            take = br".*" if field_end is None else (
+                br"(?:[ \t]*[^ \t]*){" + str(field_end - field + 1).encode() + b"}")
+        else:
+            sep = re.escape(separator)
+            chars = b"[^" + sep + b"]*"
+            skip = b"(?:" + chars + sep + b"){" + str(field - 1).encode() + b"}"
+            take = br".*" if field_end is None else (
+                chars + b"(?:" + sep + chars + b"){0," + str(field_end - field).encode() + b"}")
+        self.pattern = re.compile(skip + br"(" + take + br")")
+
+    def __call__(self, line):
+        value = line[:-1]
+        if self.pattern is not None:
+            match = self.pattern.match(value)
+            value = match.group(1) if match else b""
+        if self.numeric:
+            match = _NUMERIC_PREFIX.match(value)
+            return float(match.group(1)) if match else 0.0
+        return value
+
+
+def _line_key(field, field_end, separator, numeric):
+    if field is None and not numeric:
+        # strip the newline, so that lines are ordered before their extensions
+        return operator.itemgetter(slice(None, -1))
+    return _LineKey(field, field_end, separator, numeric)
+
+
+def _line_blocks(fps, buffersize):
+    """Read newline terminated lines in blocks of about buffersize bytes, flagging the last one"""
+    for idx, fp in enumerate(fps):
+        head = []
+        while True:
+            lines = head + fp.readlines(buffersize)
+            head = [fp.readline()] if lines else []
+            if not head or not head[0]:
+                head = []
+                if not lines:
+                    break
+                if not lines[-1].endswith(b"\n"):
+                    lines[-1] += b"\n"
+            yield lines, not head and idx == len(fps) - 1
+            if not head:
+                break
+
+
+def _write_line_run(path, lines):
+    with open(path, "wb") as fp:
+        fp.writelines(lines)
+    return path
+
+
+def _sort_line_run(task):
+    """Sort lines and write them to a run file, in a worker"""
+    lines, key, reverse, path = task
+    lines.sort(key=key, reverse=reverse)
+    return _write_line_run(path, lines)
+
+
+def _read_line_run(path, buffering):
+    with open(path, "rb", buffering) as fp:
+        for line in fp:
+            yield line
+
+
+def disksorted_lines(fp, field=None, field_end=None, separator=None, numeric=False, reverse=False,
+                     unique=False, buffersize=LINE_BUFFERSIZE, workers=1):
+    '''
+    Sorting function for newline delimited files not fitting into memory
+    Lines are handled as raw bytes. Input is read in blocks, runs are written as plain lines
+    without serialization, and merged with large buffered reads. Lines with equal keys keep their
+    input order.
+    NOTE: Uses temporary files
+    :param fp: is the binary file-object, or list of file-objects to read lines from.
+    :param field: specifies the 1-based index of the field the key starts at, like sort -k.
+        (whole line if omitted.)
+    :param field_end: specifies the 1-based index of the field the key ends with. (end of line if
+        omitted.)
+    :param separator: specifies the byte separating fields. If omitted, fields are split before
+        blanks following non-blanks, and include their leading blanks, like with sort.
+    :param numeric: is a boolean value. If set to True, then keys are compared by their leading
+        numeric value, like sort -n.
+    :param reverse: is a boolean value. If set to True, then the lines are sorted as if each
+        comparison were reversed.
+    :param unique: is a boolean value. If set to True, then only the first of lines with equal keys
+        is yielded.
+    :param buffersize: specifies the number of bytes of lines to be sorted in memory at once.
+    :param workers: specifies the number of processes to sort blocks with.
+    :type fp: file|list
+    :type field: int|NoneType
+    :type field_end: int|NoneType
+    :type separator: bytes|NoneType
+    :type numeric: bool
+    :type reverse: bool
+    :type unique: bool
+    :type buffersize: int
+    :type workers: int
+    '''
+    if field is not None and field < 1:
+        raise ValueError("field to be positive integer")
+    if field_end is not None and (field is None or field_end < field):
+        raise ValueError("field_end to be at least field")
+    if separator is not None and len(separator) != 1:
+        raise ValueError("separator to be a single byte")
+    if buffersize < 1:
+        raise ValueError("buffersize to be positive integer")
+    if workers < 1:
+        raise ValueError("workers to be positive integer")
+    fps = list(fp) if isinstance(fp, (list, tuple)) else [fp]
+    return _disksorted_lines(fps, _line_key(field, field_end, separator, numeric), reverse,
+                             unique, buffersize, workers)
+
+
+def _disksorted_lines(fps, key, reverse, unique, buffersize, workers):
+    directory = tempfile.mkdtemp(prefix="disksorted")
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        paths = []
+        pending = collections.deque()
+        resident = []
+        for lines, is_last in _line_blocks(fps, buffersize):
+            path = os.path.join(directory, "run{0}".format(len(paths) + len(pending)))
+            if pool is not None:
+                # bound the number of blocks in flight, to keep memory usage in check
+                pending.append(pool.apply_async(_sort_line_run, ((lines, key, reverse, path),)))
+                if len(pending) >= workers:
+                    paths.append(pending.popleft().get())
+            elif is_last:
+                lines.sort(key=key, reverse=reverse)
+                resident.append(iter(lines))
+            else:
+                paths.append(_sort_line_run((lines, key, reverse, path)))
+            lines = None
+        paths.extend(result.get() for result in pending)
+        buffering = max(2 ** 16, buffersize // max(len(paths), 1))
+        pieces = [_read_line_run(path, buffering) for path in paths] + resident
+        lines = pieces[0] if len(pieces) == 1 else merge(pieces, key, reverse)
+        if unique:
+            lines = (next(group) for _, group in itertools.groupby(lines, key=key))
+        for line in lines:
+            yield line
+    finally:
+        if pool is not None:
+            pool.terminate()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _parse_field(text):
+    import argparse
+    start, _, end = text.partition(",")
+    valid_start = start.isdigit() and int(start) >= 1
+    valid_end = end == "" or valid_start and end.isdigit() and int(end) >= int(start)
+    if not valid_start or not valid_end:
+        raise argparse.ArgumentTypeError("invalid field {0!r}, F or F,G expected (character "
+                                         "positions and ordering options are not supported)"
+                                         .format(text))
+    return int(start), int(end) if end else None
+
+
+def _parse_size(text):
+    import argparse
+    units = dict(K=2 ** 10, M=2 ** 20, G=2 ** 30, T=2 ** 40)
+    multiplier = units.get(text[-1:].upper(), 1)
+    number = text[:-1] if text[-1:].upper() in units else text
+    if not number.isdigit() or int(number) < 1:
+        raise argparse.ArgumentTypeError("invalid size {0!r}".format(text))
+    return int(number) * multiplier
+
+
+def main(argv=None):
+    """Command line entry point of disksort, sorting lines of files like sort"""
+    # argparse is not available on Python 2.6, which the library supports otherwise
+    import argparse
+    parser = argparse.ArgumentParser(prog="disksort", description="Sort lines of files not "
+                                     "fitting into memory, write the result to standard output. "
+                                     "Bytes are compared like sort in the C locale, and lines "
+                                     "with equal keys keep their input order, like sort -s.")
+    parser.add_argument("files", nargs="*", metavar="FILE",
+                        help="file to be sorted, standard input if omitted or -")
+    parser.add_argument("-k", "--key", metavar="F[,G]", type=_parse_field, default=(None, None),
+                        help="sort by fields F through G (end of line if omitted), instead of "
+                        "the whole line")
+    parser.add_argument("-t", "--field-separator", metavar="SEP",
+                        help="separate fields by SEP instead of before blanks following "
+                        "non-blanks")
+    parser.add_argument("-n", "--numeric-sort", action="store_true",
+                        help="compare by leading numeric value")
+    parser.add_argument("-r", "--reverse", action="store_true",
+                        help="reverse the result of comparisons")
+    parser.add_argument("-u", "--unique", action="store_true",
+                        help="output only the first of lines with equal keys")
+    parser.add_argument("-S", "--buffer-size", metavar="SIZE", type=_parse_size,
+                        default=LINE_BUFFERSIZE, help="bytes of lines to sort in memory at once, "
+                        "with optional K, M, G, T suffix")
+    parser.add_argument("--parallel", metavar="N", type=int, default=1,
+                        help="number of processes to sort with")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write result to FILE instead of standard output")
+    args = parser.parse_args(argv)
+    if args.parallel < 1:
+        parser.error("--parallel to be positive integer")
+    stdin = getattr(sys.stdin, "buffer", sys.stdin)
+    separator = args.field_separator
+    if separator is not None and not isinstance(separator, bytes):
+        separator = separator.encode(sys.getfilesystemencoding())
+    fps = []
+    try:
+        for name in args.files or ["-"]:
+            try:
+                fps.append(stdin if name == "-" else open(name, "rb"))
+            except (IOError, OSError) as error:
+                sys.stderr.write("disksort: cannot read {0}: {1}\n".format(name, error.strerror))
+                return 2
+        lines = disksorted_lines(fps, field=args.key[0], field_end=args.key[1],
+                                 separator=separator, numeric=args.numeric_sort,
+                                 reverse=args.reverse, unique=args.unique,
+                                 buffersize=args.buffer_size,
+                                 workers=args.parallel)
+        # all input is consumed before the first line is yielded, output may overwrite input
+        first = next(lines, None)
+        if args.output is not None:
+            out = open(args.output, "wb")
+        else:
+            out = getattr(sys.stdout, "buffer", sys.stdout)
+        try:
+            if first is not None:
+                out.write(first)
+                out.writelines(lines)
+            out.flush()
+        finally:
+            if out is not getattr(sys.stdout, "buffer", sys.stdout):
+                out.close()
+    finally:
+        for fp in fps:
+            if fp is not stdin:
+                fp.close()
+    return 0
+
+
 if sys.version_info[0] == 2:
     _disksorted = disksorted
     def disksorted(iterable, cmp=None, key=None, reverse=False, chunksize=sys.maxint,
-                   serializer=SERIALIZER_PICKLE):
+                   serializer=SERIALIZER_PICKLE, cache=None, fingerprint=None, workdir=None,
+                   merge_workers=1, memory_budget=0, batch_key=None):
         if cmp:
             key = functools.cmp_to_key(cmp)
         return _disksorted(iterable, key=key, reverse=reverse, chunksize=chunksize,
-                           serializer=serializer)
+                           serializer=serializer, cache=cache, fingerprint=fingerprint,
+                           workdir=workdir, merge_workers=merge_workers,
+                           memory_budget=memory_budget, batch_key=batch_key)
     disksorted.__doc__ = _disksorted.__doc__
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,6 +33,11 @@ setup(
     py_modules=[
         'disksorted',
     ],
+    entry_points={
+        'console_scripts': [
+            'disksort = disksorted:main',
+        ],
+    },
     include_package_data=True,
     install_requires=requirements,
     license="ISCL",
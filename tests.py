@@ -10,9 +10,17 @@ Tests for `python-disksorted` module.
 
 import unittest
 
+import disksorted as disksorted_module
 from disksorted import disksorted, SERIALIZER_JSON, SERIALIZER_MARSHAL
+from disksorted import disksorted_join, disksorted_groupby, JOIN_INNER, JOIN_LEFT, JOIN_OUTER
+from disksorted import DiskSortedCollection, SortCache, AdaptiveChunksize, disksorted_lines
+import io
+import os
+import shutil
+import tempfile
 import random
 import collections
+import operator
 import sys
 
 IS_PY3 = sys.version_info[0] == 3
@@ -26,6 +34,11 @@ lrange = lambda x:list(range(x))
 
 
 TestNamedTuple = collections.namedtuple("TestNamedTuple", "value")
+TestPair = collections.namedtuple("TestPair", "a b")
+
+
+def batch_negate(items):
+    return [-item for item in items]
 
 
 class TestPythonDisksorted(unittest.TestCase):
@@ -76,10 +89,367 @@ class TestPythonDisksorted(unittest.TestCase):
         self.assertEqual(list(disksorted(lrange(10), chunksize=4, serializer=SERIALIZER_JSON)), lrange(10))
         self.assertEqual(list(disksorted(self.get_some_unicode_array(), chunksize=1, serializer=SERIALIZER_JSON)), self.get_some_unicode_array())
 
+    def test_serialize_json_tuples(self):
+        initial = [(2, 'b'), (1, 'a'), (3, 'c')]
+        self.assertEqual(list(disksorted(initial, chunksize=2, serializer=SERIALIZER_JSON)),
+                         [[1, 'a'], [2, 'b'], [3, 'c']])
+        result = list(disksorted_join(initial, [(4, 'y'), (2, 'z'), (0, 'x')], key=lambda x: x[0],
+                                      chunksize=2, serializer=SERIALIZER_JSON))
+        self.assertEqual(result, [([2, 'b'], [2, 'z'])])
+
     def test_serialize_marshal(self):
         self.assertEqual(list(disksorted(lrange(10), chunksize=4, serializer=SERIALIZER_MARSHAL)), lrange(10))
         self.assertEqual(list(disksorted(self.get_some_unicode_array(), chunksize=1, serializer=SERIALIZER_MARSHAL)), self.get_some_unicode_array())
 
+    def test_groupby(self):
+        initial = [3, 1, 2, 3, 1, 3]
+        result = [(k, len(list(g))) for k, g in disksorted_groupby(initial, chunksize=2)]
+        self.assertEqual(result, [(1, 2), (2, 1), (3, 3)])
+        result = [(k, sorted(g)) for k, g in disksorted_groupby(lrange(10), key=lambda x: x % 3,
+                                                                 chunksize=4, reverse=True)]
+        self.assertEqual(result, [(2, [2, 5, 8]), (1, [1, 4, 7]), (0, [0, 3, 6, 9])])
+
+    def test_join(self):
+        left = [(3, 'c'), (1, 'a'), (2, 'b'), (5, 'e')]
+        right = [(4, 'D'), (2, 'B'), (1, 'A'), (2, 'BB')]
+        key = lambda x: x[0]
+        def ljoin(*args, **kwargs):
+            return sorted(disksorted_join(left, right, key=key, chunksize=2, *args, **kwargs),
+                          key=repr)
+        self.assertEqual(ljoin(), [((1, 'a'), (1, 'A')), ((2, 'b'), (2, 'B')), ((2, 'b'), (2, 'BB'))])
+        self.assertEqual(ljoin(how=JOIN_INNER), ljoin())
+        self.assertEqual(ljoin(how=JOIN_LEFT), ljoin() + [((3, 'c'), None), ((5, 'e'), None)])
+        self.assertEqual(ljoin(how=JOIN_OUTER), ljoin(how=JOIN_LEFT) + [(None, (4, 'D'))])
+        self.assertRaises(ValueError, disksorted_join, left, right, how='cross')
+
+    def test_join_many_to_many(self):
+        left = [i % 3 for i in lrange(30)]
+        right = [i % 2 for i in lrange(20)]
+        for serializer in [None, SERIALIZER_JSON, SERIALIZER_MARSHAL]:
+            kwargs = dict(serializer=serializer) if serializer else {}
+            result = list(disksorted_join(left, right, chunksize=7, groupsize=3, **kwargs))
+            self.assertEqual(result, [(0, 0)] * 100 + [(1, 1)] * 100)
+
+    def test_collection(self):
+        with DiskSortedCollection(chunksize=10, fanout=3) as collection:
+            expected = []
+            for _ in range(10):
+                batch = [random.randint(0, 100) for _ in range(17)]
+                collection.extend(batch)
+                collection.add(-1)
+                expected = sorted(expected + batch + [-1])
+                self.assertEqual(list(collection), expected)
+                self.assertEqual(len(collection), len(expected))
+                self.assertTrue(len(collection.runs) < 3 * 3)
+            collection.compact()
+            self.assertEqual(len(collection.runs), 1)
+            self.assertEqual(list(collection), expected)
+            directory = collection.directory
+        self.assertFalse(os.path.exists(directory))
+
+    def test_collection_extend(self):
+        with DiskSortedCollection(chunksize=10) as collection:
+            collection.extend(lrange(5))
+            collection.extend(lrange(10))
+            self.assertEqual([count for _, count in collection.runs], [10])
+            self.assertEqual(len(collection.buffer), 5)
+            self.assertEqual(list(collection), sorted(lrange(5) + lrange(10)))
+
+    def test_collection_reverse(self):
+        with DiskSortedCollection(key=lambda x: x % 7, reverse=True, chunksize=4,
+                                  serializer=SERIALIZER_JSON) as collection:
+            collection.extend(lrange(30))
+            result = list(collection)
+            self.assertEqual(sorted(result), lrange(30))
+            self.assertEqual([x % 7 for x in result], sorted([x % 7 for x in lrange(30)], reverse=True))
+        self.assertRaises(ValueError, DiskSortedCollection, chunksize=0)
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = SortCache(directory)
+        def untouchable():
+            raise AssertionError("input consumed on cache hit")
+            yield
+        initial = lrange(100)
+        random.shuffle(initial)
+        for chunksize in [1000, 7]:
+            fingerprint = ("initial", chunksize)
+            self.assertEqual(list(disksorted(initial, chunksize=chunksize, cache=cache,
+                                             fingerprint=fingerprint)), lrange(100))
+            self.assertEqual(list(disksorted(untouchable(), chunksize=chunksize, cache=cache,
+                                             fingerprint=fingerprint)), lrange(100))
+        self.assertEqual(list(disksorted(initial, reverse=True, cache=cache,
+                                         fingerprint=("initial", 7))), lrange(100)[::-1])
+        self.assertRaises(ValueError, list, disksorted(initial, cache=cache))
+
+    def test_cache_key_identity(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = SortCache(directory)
+        initial = [TestPair(i, -i) for i in lrange(20)]
+        random.shuffle(initial)
+        by_a = list(disksorted(initial, key=lambda x: x.a, cache=cache, fingerprint="f"))
+        by_b = list(disksorted(initial, key=lambda x: x.b, cache=cache, fingerprint="f"))
+        self.assertEqual(by_a, sorted(initial))
+        self.assertEqual(by_b, sorted(initial)[::-1])
+        self.assertEqual(len(os.listdir(directory)), 2)
+        def make_key(idx):
+            return lambda x: x[idx]
+        self.assertEqual(list(disksorted(initial, key=make_key(1), cache=cache, fingerprint="g")),
+                         sorted(initial)[::-1])
+        self.assertEqual(list(disksorted(initial, key=make_key(0), cache=cache, fingerprint="g")),
+                         sorted(initial))
+        def key_with_default(x, idx=1):
+            return x[idx]
+        self.assertEqual(list(disksorted(initial, key=key_with_default, cache=cache,
+                                         fingerprint="g")), sorted(initial)[::-1])
+        key_with_default.__defaults__ = (0,)
+        self.assertEqual(list(disksorted(initial, key=key_with_default, cache=cache,
+                                         fingerprint="g")), sorted(initial))
+
+    def test_cache_file_and_eviction(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "input.txt")
+        with open(path, "w") as fp:
+            fp.write("b\nc\na\n")
+        cache = SortCache(os.path.join(directory, "cache"), maxsize=1)
+        for _ in range(2):
+            with open(path) as fp:
+                self.assertEqual(list(disksorted(fp, chunksize=2, cache=cache)), ["a\n", "b\n", "c\n"])
+        self.assertEqual(len(os.listdir(cache.directory)), 1)
+        list(disksorted([1], cache=cache, fingerprint="other"))
+        self.assertEqual(len(os.listdir(cache.directory)), 1)
+        cache.clear()
+        self.assertEqual(os.listdir(cache.directory), [])
+
+    def test_workdir_resume(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        initial = lrange(100)
+        random.shuffle(initial)
+        def crashing(limit):
+            for idx, item in enumerate(initial):
+                if idx == limit:
+                    raise KeyboardInterrupt()
+                yield item
+        self.assertRaises(KeyboardInterrupt, list, disksorted(crashing(45), chunksize=10,
+                                                               workdir=workdir))
+        self.assertEqual(len(os.listdir(workdir)), 5)
+        consumed = []
+        def tracking():
+            for item in initial:
+                consumed.append(item)
+                yield item
+        self.assertRaises(ValueError, list, disksorted(tracking(), chunksize=20, workdir=workdir))
+        self.assertEqual(list(disksorted(tracking(), chunksize=10, workdir=workdir)), lrange(100))
+        self.assertEqual(len(consumed), 100)
+        self.assertEqual(os.listdir(workdir), [])
+
+    def test_workdir_parameters(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        initial = [TestPair(i, -i) for i in lrange(20)]
+        result = disksorted(initial, key=lambda x: x.a, chunksize=3, workdir=workdir,
+                            fingerprint="v1")
+        self.assertEqual(next(result), initial[0])
+        del result
+        self.assertRaises(ValueError, list, disksorted(initial, key=lambda x: x.b, chunksize=3,
+                                                       workdir=workdir, fingerprint="v1"))
+        self.assertRaises(ValueError, list, disksorted(initial, key=lambda x: x.a, chunksize=3,
+                                                       workdir=workdir, fingerprint="v2"))
+        self.assertEqual(list(disksorted(initial, key=lambda x: x.a, chunksize=3,
+                                         workdir=workdir, fingerprint="v1")), initial)
+        def make_key(idx):
+            return lambda x: x[idx]
+        result = disksorted(initial, key=make_key(0), chunksize=3, workdir=workdir)
+        self.assertEqual(next(result), initial[0])
+        del result
+        self.assertRaises(ValueError, list, disksorted(initial, key=make_key(1), chunksize=3,
+                                                       workdir=workdir))
+        self.assertEqual(list(disksorted(initial, key=make_key(0), chunksize=3, workdir=workdir)),
+                         initial)
+
+    def test_workdir_complete(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        result = disksorted(lrange(10)[::-1], chunksize=3, workdir=workdir, serializer=SERIALIZER_JSON)
+        self.assertEqual(next(result), 0)
+        del result
+        self.assertEqual(list(disksorted([], chunksize=3, workdir=workdir, serializer=SERIALIZER_JSON)),
+                         lrange(10))
+        self.assertEqual(os.listdir(workdir), [])
+
+    def test_merge_workers(self):
+        initial = [random.randint(0, 500) for _ in lrange(5000)]
+        self.assertEqual(list(disksorted(initial, chunksize=700, merge_workers=3)), sorted(initial))
+        self.assertEqual(list(disksorted(initial, chunksize=700, merge_workers=4, reverse=True,
+                                         serializer=SERIALIZER_MARSHAL)), sorted(initial, reverse=True))
+        pairs = [(random.randint(0, 50), 'x') for _ in lrange(1000)]
+        self.assertRaises(ValueError, list, disksorted(pairs, chunksize=300, merge_workers=3,
+                                                       serializer=SERIALIZER_JSON))
+        pairs = [(x % 10, idx) for idx, x in enumerate(initial)]
+        self.assertEqual(list(disksorted(pairs, key=operator.itemgetter(0), chunksize=300,
+                                         merge_workers=2)),
+                         sorted(pairs, key=operator.itemgetter(0)))
+        self.assertEqual(list(disksorted([1] * 1000, chunksize=100, merge_workers=3)), [1] * 1000)
+        self.assertEqual(list(disksorted([], merge_workers=3)), [])
+        pool = disksorted_module.multiprocessing.Pool
+        def failing_pool(*args, **kwargs):
+            raise AssertionError("pool created for a single chunk")
+        disksorted_module.multiprocessing.Pool = failing_pool
+        try:
+            self.assertEqual(list(disksorted(initial, merge_workers=4)), sorted(initial))
+            self.assertEqual(list(disksorted(initial, chunksize=5000, merge_workers=4)), sorted(initial))
+        finally:
+            disksorted_module.multiprocessing.Pool = pool
+        self.assertRaises(ValueError, list, disksorted([], merge_workers=0))
+
+    def test_memory_budget(self):
+        created = []
+        temporary_file = disksorted_module.tempfile.TemporaryFile
+        def tracking_temporary_file(*args, **kwargs):
+            created.append(args)
+            return temporary_file(*args, **kwargs)
+        disksorted_module.tempfile.TemporaryFile = tracking_temporary_file
+        try:
+            def count_files(**kwargs):
+                del created[:]
+                kwargs.setdefault("chunksize", 5)
+                self.assertEqual(list(disksorted(lrange(10)[::-1], **kwargs)), lrange(10))
+                return len(created)
+            self.assertEqual(count_files(), 1)
+            self.assertEqual(count_files(memory_budget=2 ** 20), 0)
+            self.assertEqual(count_files(memory_budget=2 ** 20, serializer=SERIALIZER_JSON), 0)
+            self.assertEqual(count_files(memory_budget=1), 1)
+            self.assertEqual(count_files(chunksize=2), 4)
+            self.assertEqual(count_files(chunksize=10), 0)
+            self.assertRaises(ValueError, list, disksorted([], memory_budget=1, merge_workers=2))
+            self.assertRaises(ValueError, list, disksorted([], memory_budget=1, workdir="."))
+        finally:
+            disksorted_module.tempfile.TemporaryFile = temporary_file
+
+    def test_adaptive_chunksize(self):
+        initial = lrange(1000)
+        random.shuffle(initial)
+        chunksize = AdaptiveChunksize(soft_limit=None, reserve=None, initial=50, minimum=10,
+                                      maximum=200, check_every=7)
+        self.assertEqual(list(disksorted(initial, chunksize=chunksize)), lrange(1000))
+        self.assertEqual(chunksize.sizes, [50, 100, 200, 200, 200, 200, 50])
+        chunksize = AdaptiveChunksize(soft_limit=1, reserve=None, initial=100, minimum=10,
+                                      check_every=7)
+        self.assertEqual(list(disksorted(initial, chunksize=chunksize, merge_workers=2)),
+                         lrange(1000))
+        self.assertEqual(chunksize.sizes[:4], [14, 10, 10, 10])
+        self.assertEqual(sum(chunksize.sizes), 1000)
+        self.assertRaises(ValueError, AdaptiveChunksize, initial=10, minimum=20)
+
+    def test_cgroup_available_memory(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        cgroup_root = disksorted_module._CGROUP_ROOT
+        disksorted_module._CGROUP_ROOT = root
+        try:
+            self.assertEqual(disksorted_module._cgroup_available_memory(), None)
+            os.mkdir(os.path.join(root, "memory"))
+            for name, value in [("memory.limit_in_bytes", "5000"), ("memory.usage_in_bytes", "4000"),
+                                ("memory.stat", "cache 700\ntotal_inactive_file 500\n")]:
+                with open(os.path.join(root, "memory", name), "w") as fp:
+                    fp.write(value)
+            self.assertEqual(disksorted_module._cgroup_available_memory(), 1500)
+            for name, value in [("memory.max", "1000\n"), ("memory.current", "900\n"),
+                                ("memory.stat", "anon 700\ninactive_file 100\n")]:
+                with open(os.path.join(root, name), "w") as fp:
+                    fp.write(value)
+            self.assertEqual(disksorted_module._cgroup_available_memory(), 200)
+            self.assertEqual(disksorted_module._available_memory(), 200)
+            with open(os.path.join(root, "memory.max"), "w") as fp:
+                fp.write("max\n")
+            self.assertEqual(disksorted_module._cgroup_available_memory(), 1500)
+        finally:
+            disksorted_module._CGROUP_ROOT = cgroup_root
+
+    def test_batch_key(self):
+        initial = lrange(100)
+        random.shuffle(initial)
+        calls = []
+        def batch_key(items):
+            calls.append(len(items))
+            return batch_negate(items)
+        self.assertEqual(list(disksorted(initial, chunksize=30, batch_key=batch_key)), lrange(100)[::-1])
+        self.assertEqual(calls, [30, 30, 30, 10])
+        self.assertEqual(list(disksorted(initial, chunksize=30, batch_key=batch_negate, reverse=True,
+                                         serializer=SERIALIZER_JSON)), lrange(100))
+        self.assertEqual(list(disksorted(initial, chunksize=30, batch_key=batch_negate,
+                                         merge_workers=2)), lrange(100)[::-1])
+        numbered = [(random.randint(0, 9), idx) for idx in range(100)]
+        def batch_first(items):
+            return [item[0] for item in items]
+        for chunksize in (30, 100):
+            for reverse in (False, True):
+                self.assertEqual(list(disksorted(numbered, chunksize=chunksize, reverse=reverse,
+                                                 batch_key=batch_first)),
+                                 sorted(numbered, key=operator.itemgetter(0), reverse=reverse))
+        self.assertEqual(list(disksorted(numbered, batch_key=batch_first, merge_workers=2)),
+                         sorted(numbered, key=operator.itemgetter(0)))
+        self.assertRaises(ValueError, list, disksorted(initial, key=abs, batch_key=batch_negate))
+        self.assertRaises(ValueError, list, disksorted(initial, batch_key=lambda items: items[1:]))
+
+    def test_lines(self):
+        initial = b"b\t2\na\t10\nc\t1.5x\na\nab\n\nd\t-3\na\t10"
+        def lsorted(**kwargs):
+            return b"".join(disksorted_lines(io.BytesIO(initial), **kwargs))
+        expected = b"\na\na\t10\na\t10\nab\nb\t2\nc\t1.5x\nd\t-3\n"
+        self.assertEqual(lsorted(), expected)
+        self.assertEqual(lsorted(buffersize=4), expected)
+        self.assertEqual(lsorted(buffersize=4, workers=2), expected)
+        self.assertEqual(lsorted(unique=True, buffersize=8), b"\na\na\t10\nab\nb\t2\nc\t1.5x\nd\t-3\n")
+        self.assertEqual(lsorted(field=2, field_end=2, separator=b"\t", numeric=True, reverse=True,
+                                 buffersize=4),
+                         b"a\t10\na\t10\nb\t2\nc\t1.5x\na\nab\n\nd\t-3\n")
+        self.assertEqual(lsorted(field=1, field_end=1, unique=True),
+                         b"\na\t10\nab\nb\t2\nc\t1.5x\nd\t-3\n")
+        self.assertEqual(list(disksorted_lines([io.BytesIO(b"b"), io.BytesIO(b""), io.BytesIO(b"a\n")])),
+                         [b"a\n", b"b\n"])
+        self.assertRaises(ValueError, disksorted_lines, io.BytesIO(initial), field=0)
+
+    def test_lines_fields(self):
+        def lsorted(initial, **kwargs):
+            return b"".join(disksorted_lines(io.BytesIO(initial), **kwargs))
+        initial = b"a 2 x\nb 1 z\nc 1 y\n"
+        self.assertEqual(lsorted(initial, field=2), b"c 1 y\nb 1 z\na 2 x\n")
+        self.assertEqual(lsorted(initial, field=2, field_end=2), b"b 1 z\nc 1 y\na 2 x\n")
+        self.assertEqual(lsorted(initial, field=2, field_end=3), b"c 1 y\nb 1 z\na 2 x\n")
+        # fields include their leading blanks
+        initial = b"x  b\ny a\nz\tc\n"
+        self.assertEqual(lsorted(initial, field=2), b"z\tc\nx  b\ny a\n")
+        self.assertEqual(lsorted(initial, field=2, numeric=True), initial)
+        initial = b"3,b,x\n1,b\n2,a,y\n4\n"
+        self.assertEqual(lsorted(initial, field=2, field_end=2, separator=b","),
+                         b"4\n2,a,y\n3,b,x\n1,b\n")
+        self.assertEqual(lsorted(initial, field=2, separator=b","), b"4\n2,a,y\n1,b\n3,b,x\n")
+        self.assertRaises(ValueError, disksorted_lines, io.BytesIO(initial), field=2, field_end=1)
+        self.assertRaises(ValueError, disksorted_lines, io.BytesIO(initial), separator=b",;")
+
+    def test_lines_main(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "input.tsv")
+        with open(path, "wb") as fp:
+            fp.write(b"x,3\ny,1\nz,2\n")
+        self.assertEqual(disksorted_module.main(["-t", ",", "-k", "2,2", "-n", "-o", path, path]), 0)
+        with open(path, "rb") as fp:
+            self.assertEqual(fp.read(), b"y,1\nz,2\nx,3\n")
+        stderr = sys.stderr
+        sys.stderr = io.StringIO() if IS_PY3 else io.BytesIO()
+        try:
+            missing = os.path.join(directory, "missing.tsv")
+            self.assertEqual(disksorted_module.main([path, missing]), 2)
+            self.assertTrue(sys.stderr.getvalue().startswith("disksort: cannot read " + missing))
+        finally:
+            sys.stderr = stderr
+
     def get_some_unicode_array(self):
         return ['apple', u'\xe1\xe9\xfa\u0171\u0151']
 